@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
+import atexit
+import concurrent.futures
+import io
+import json
 import os
 import re
+import signal
 import sys
+import tempfile
 import time
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Sequence, Tuple
 from datetime import datetime
 
 try:
@@ -12,7 +19,7 @@ try:
 except Exception:
     ZoneInfo = None
 
-from playwright.sync_api import sync_playwright
+from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
 
 # ------------------ Config via ENV ------------------
 LOGIN_URL = "https://secure.xserver.ne.jp/xapanel/login/xserver/?request_page=xmgame%2Findex"
@@ -31,161 +38,341 @@ RENEW_HOURS = int(os.getenv("RENEW_HOURS", "72"))
 RENEW_LOG_MD = os.getenv("RENEW_LOG_MD", "renew_result.md")
 LOG_TIMEZONE = os.getenv("LOG_TIMEZONE", "Asia/Tokyo")
 
+# 登录态（storage_state）缓存：命中则跳过登录
+STORAGE_STATE = os.getenv("STORAGE_STATE", ".playwright/state.json")
+# 登录态最长复用时间（小时），超时强制重新登录
+STATE_MAX_AGE_HOURS = float(os.getenv("STATE_MAX_AGE_HOURS", "6"))
+# 上次命中的选择器，下次优先尝试
+SELECTOR_CACHE = os.getenv("SELECTOR_CACHE", ".playwright/selector_cache.json")
+# 可选：持久化浏览器 profile（保留 Cookie 等），设置后用 launch_persistent_context
+USER_DATA_DIR = os.getenv("PW_USER_DATA_DIR", "").strip()
+
 # 等待（做了加速）
-DEFAULT_TIMEOUT = int(os.getenv("PLAYWRIGHT_TIMEOUT_MS", "12000"))
+DEFAULT_TIMEOUT = int(os.getenv("PLAYWRIGHT_TIMEOUT_MS", "12000"))  # 导航/长等待
+ACTION_TIMEOUT = int(os.getenv("PLAYWRIGHT_ACTION_TIMEOUT_MS", "5000"))  # 其余操作默认值
 SHORT_TIMEOUT = 3000
 
+# goto 的就绪锚点：已登录时列表页的“ゲーム管理”，未登录时跳到登录页的密码框
+GAME_MGMT_ANCHOR = ':is(button,a,[role="button"]):has-text("ゲーム管理")'
+LOGIN_FORM_ANCHOR = 'input[type="password"]'
+SESSION_ANCHOR = f"{GAME_MGMT_ANCHOR}, {LOGIN_FORM_ANCHOR}"
+
+# 过程截图/HTML 仅在 DEBUG_ARTIFACTS=1 时保存；失败路径始终保存
+DEBUG_ARTIFACTS = os.getenv("DEBUG_ARTIFACTS", "0") != "0"
+# 截图默认只截视口（JPEG）；调试时设置 DEBUG_SCREENSHOTS=1 截整页
+FULL_PAGE_SNAP = os.getenv("DEBUG_SCREENSHOTS", "0") != "0"
+
+# 脚本只读文字、点按钮，这些资源直接拦掉（保留 stylesheet，is_visible 判断依赖样式）
+# 调试需要完整截图时设置 BLOCK_ASSETS=0
+BLOCK_ASSETS = os.getenv("BLOCK_ASSETS", "1") != "0"
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+TRACKER_RE = re.compile(
+    r"google-analytics\.com|googletagmanager\.com|doubleclick\.net|hotjar\.com"
+    r"|googlesyndication\.com|googleadservices\.com|facebook\.net|clarity\.ms|ads-twitter\.com|yjtag\.jp"
+)
+
+# Chromium 启动参数：Playwright 自带的默认开关已经关掉后台任务等，这里只补这三项；
+# 不要再加 --disable-features，会覆盖掉 Playwright 自己的那份
+CHROMIUM_ARGS = ["--no-sandbox", "--disable-gpu", "--disable-dev-shm-usage"]
+
 # ------------------ Utilities ------------------
-def log(msg: str):
-    print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}", flush=True)
+# stdout 走 64KB 缓冲，避免每条日志一次 write；每个大步骤开始、失败路径和退出时 flush，
+# 这样 Actions 里能看到进度，任务被强杀时也只丢当前步骤的日志
+_LOG_BUF = io.BufferedWriter(io.FileIO(sys.stdout.fileno(), "wb", closefd=False), buffer_size=65536)
+atexit.register(_LOG_BUF.flush)
+
+def log(msg: str, flush: bool = False):
+    _LOG_BUF.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {msg}\n".encode("utf-8"))
+    if flush:
+        _LOG_BUF.flush()
+
+def _on_sigterm(signum, frame):
+    # 取消/超时先发 SIGTERM：落盘后退出（默认处理不会跑 atexit）
+    try:
+        _LOG_BUF.flush()
+    except Exception:
+        pass  # 正好打断了一次 write 时会报重入，丢这一小段也要先退出
+    os._exit(128 + signum)
+
+signal.signal(signal.SIGTERM, _on_sigterm)
+
+_SAFE_NAME_RE = re.compile(r"[^a-zA-Z0-9_.\-]+")
 
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
-def snap(page, name: str):
+# 截图编码后的落盘交给后台线程，不阻塞后续 Playwright 调用
+_SNAP_EXEC = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+def _write_snap(filepath: Path, data: bytes):
+    try:
+        filepath.write_bytes(data)
+        log(f"Saved screenshot: {filepath}")
+    except Exception as e:
+        log(f"Screenshot write failed: {e}")
+
+def snap(page, name: str, force: bool = False):
+    if not (DEBUG_ARTIFACTS or force):
+        return
     try:
         out = Path("screenshots")
         ensure_dir(out)
-        safe_name = re.sub(r"[^a-zA-Z0-9_\-\.]+", "_", name)
-        filepath = out / f"{int(time.time())}_{safe_name}.png"
-        page.screenshot(path=str(filepath), full_page=True)
-        log(f"Saved screenshot: {filepath}")
+        safe_name = _SAFE_NAME_RE.sub("_", name)
+        filepath = out / f"{int(time.time())}_{safe_name}.jpg"
+        data = page.screenshot(full_page=FULL_PAGE_SNAP, type="jpeg", quality=60)
+        _SNAP_EXEC.submit(_write_snap, filepath, data)
     except Exception as e:
         log(f"Screenshot failed: {e}")
 
-def dump_html(page, name: str):
+def dump_html(page, name: str, force: bool = False):
+    if not (DEBUG_ARTIFACTS or force):
+        return
     try:
         out = Path("pages")
         ensure_dir(out)
-        safe = re.sub(r"[^a-zA-Z0-9_\-\.]+", "_", name)
+        safe = _SAFE_NAME_RE.sub("_", name)
         p = out / f"{int(time.time())}_{safe}.html"
         p.write_text(page.content(), encoding="utf-8")
         log(f"Saved page html: {p}")
     except Exception as e:
         log(f"Dump html failed: {e}")
 
+def snap_error(page, name: str):
+    snap(page, name, force=True)
+    dump_html(page, name, force=True)
+    _LOG_BUF.flush()
+
+# 误把 Set-Cookie 属性一起粘贴进来时跳过
+COOKIE_ATTRS = frozenset({"path", "domain", "expires", "max-age", "samesite", "secure", "httponly"})
+_COOKIE_RE = re.compile(r"\s*([^=;\s]+)\s*=\s*([^;]*)")
+COOKIE_TEMPLATE = {"path": "/", "httpOnly": False, "secure": True, "sameSite": "Lax"}
+
 def parse_cookie_string(cookie_str: str, domain: str) -> List[dict]:
-    cookies = []
-    for item in [p.strip() for p in cookie_str.split(";") if p.strip()]:
-        if "=" not in item:
-            continue
-        name, value = item.split("=", 1)
-        cookies.append({
-            "name": name.strip(),
-            "value": value.strip(),
-            "domain": domain,
-            "path": "/",
-            "httpOnly": False,
-            "secure": True,
-            "sameSite": "Lax"
-        })
-    return cookies
+    return [
+        {**COOKIE_TEMPLATE, "name": name, "value": value.strip(), "domain": domain}
+        for name, value in _COOKIE_RE.findall(cookie_str)
+        if name.lower() not in COOKIE_ATTRS
+    ]
+
+# 页面可见文本（innerText 不含隐藏元素）里是否包含任一候选
+HAS_TEXT_JS = """(texts) => {
+    const t = (document.body && document.body.innerText) || '';
+    return texts.some(x => t.includes(x));
+}"""
+
+LOGGED_IN_MARKERS = ("ログアウト", "マイページ", "アカウント", "お知らせ")
+# Playwright 的 text=/.../ 是 JS 正则，无需 Python 转义
+LOGGED_IN_SELECTOR = f"text=/{'|'.join(LOGGED_IN_MARKERS)}/ >> visible=true"
 
 def is_logged_in(page) -> bool:
-    for t in ["ログアウト", "マイページ", "アカウント", "お知らせ"]:
-        try:
-            if page.get_by_text(t, exact=False).first.is_visible():
-                return True
-        except Exception:
-            pass
-    return False
+    try:
+        return bool(page.evaluate(HAS_TEXT_JS, list(LOGGED_IN_MARKERS)))
+    except Exception:
+        pass
+    try:
+        return page.locator(LOGGED_IN_SELECTOR).count() > 0
+    except Exception:
+        return False
 
-def try_click(page_or_frame, locator, timeout=SHORT_TIMEOUT) -> bool:
+def settle_after_click(page_or_frame, settle_ms: int = 0):
+    # 导航后的就绪由下一步的 wait_for_text / wait_ready 负责；仅在确需停顿（如 radio 动画）时等待
+    if settle_ms:
+        page_or_frame.wait_for_timeout(settle_ms)
+
+def try_click(page_or_frame, locator, timeout=SHORT_TIMEOUT, settle_ms: int = 0) -> bool:
     try:
         locator.first.click(timeout=timeout)
-        page_or_frame.wait_for_timeout(200)
-        return True
     except Exception:
         return False
+    settle_after_click(page_or_frame, settle_ms)
+    return True
+
+@lru_cache(maxsize=128)
+def text_selectors(t: str, labels: bool = True) -> Tuple[str, ...]:
+    # 按 按钮 > 链接 > label 分层，保持原先 role 优先的顺序
+    tiers = (
+        f':is(button,[role="button"]):has-text("{t}"), input:is([type="submit"],[type="button"])[value*="{t}"]',
+        f'a:has-text("{t}"), input:not([type="hidden"])[value*="{t}"]',
+    )
+    return (tiers + (f'label:has-text("{t}")',)) if labels else tiers
+
+@lru_cache(maxsize=64)
+def texts_pattern(texts: Tuple[str, ...]):
+    return re.compile("|".join(re.escape(t) for t in texts))
 
-def click_by_text(page, texts: List[str], roles=("button", "link"), timeout=SHORT_TIMEOUT) -> bool:
+def click_by_text(page_or_frame, texts: Sequence[str], timeout=SHORT_TIMEOUT, labels: bool = True) -> bool:
     for t in texts:
-        for r in roles:
+        tiers = text_selectors(t, labels)
+        try:
+            # 并集只用来等一次出现；点击时按层取，避免 DOM 顺序靠前的 label/链接抢先
+            page_or_frame.locator(", ".join(tiers)).first.wait_for(state="attached", timeout=timeout)
+        except Exception:
+            continue
+        for sel in tiers:
             try:
-                if try_click(page, page.get_by_role(r, name=t, exact=False), timeout=timeout):
+                loc = page_or_frame.locator(sel)
+                if loc.count() > 0 and try_click(page_or_frame, loc, timeout=timeout):
                     return True
             except Exception:
                 pass
+    # 兜底：div/span 之类做成的按钮
+    for t in texts:
         try:
-            if try_click(page, page.get_by_text(t, exact=False), timeout=timeout):
+            loc = page_or_frame.get_by_text(t, exact=False)
+            if not labels:
+                loc = loc.and_(page_or_frame.locator(":not(label)"))
+            if try_click(page_or_frame, loc, timeout=timeout):
                 return True
         except Exception:
             pass
-        for sel in [f'a:has-text("{t}")', f'button:has-text("{t}")', f'input[value*="{t}"]', f'label:has-text("{t}")']:
-            try:
-                if try_click(page, page.locator(sel), timeout=timeout):
-                    return True
-            except Exception:
-                pass
     return False
 
-def click_text_global(page, texts):
-    if click_by_text(page, texts):
+# 在一个 frame 内按文字顺序、再按 按钮 > 链接 > label 的优先级找第一个真正可见、可用的元素
+JS_FIND_FIRST = """([texts, labels]) => {
+    const tiers = ['button,input[type=submit],input[type=button],[role=button]', 'a'];
+    if (labels) tiers.push('label');
+    const visible = el => el.checkVisibility
+        ? el.checkVisibility({opacityProperty: true, visibilityProperty: true})
+        : el.getClientRects().length > 0;
+    for (const t of texts) {
+        for (const sel of tiers) {
+            for (const el of document.querySelectorAll(sel)) {
+                const v = (el.innerText || el.value || '').trim();
+                if (v.includes(t) && !el.disabled && visible(el)) return el;
+            }
+        }
+    }
+    return null;
+}"""
+
+def js_click_first(page_or_frame, texts: Sequence[str], labels: bool = True) -> bool:
+    # JS 一次定位，再用 Playwright 点击（真实鼠标事件 + 可操作性检查）；点不动就交给后面的定位器兜底
+    try:
+        el = page_or_frame.evaluate_handle(JS_FIND_FIRST, [list(texts), labels]).as_element()
+        if el is None:
+            return False
+        el.click(timeout=SHORT_TIMEOUT)
+        settle_after_click(page_or_frame)
         return True
+    except Exception:
+        return False
+
+def click_text_global(page, texts: Sequence[str], labels: bool = True):
+    # 每个 frame（含跨域 iframe）先走一次页面内查找，命中即停；
+    # 提交类按钮传 labels=False，免得点到“ログインID”“…確認しました”之类的 label
+    for fr in [page.main_frame] + [f for f in page.frames if f != page.main_frame]:
+        if js_click_first(fr, texts, labels):
+            return True
+    # 兜底：Playwright 定位（可等待元素出现，也覆盖 div/span 按钮）
+    if click_by_text(page, texts, labels=labels):
+        return True
+    pattern = texts_pattern(tuple(texts))
     for fr in page.frames:
         if fr == page.main_frame:
             continue
         try:
-            for t in texts:
-                try:
-                    if try_click(fr, fr.get_by_role("button", name=t, exact=False)):
-                        return True
-                except Exception:
-                    pass
-                try:
-                    if try_click(fr, fr.get_by_text(t, exact=False)):
-                        return True
-                except Exception:
-                    pass
-                for sel in [f'a:has-text("{t}")', f'button:has-text("{t}")', f'input[value*="{t}"]', f'label:has-text("{t}")']:
-                    try:
-                        if try_click(fr, fr.locator(sel)):
-                            return True
-                    except Exception:
-                        pass
+            # 子 frame 里一个候选文字都没有就跳过，免得逐个文字等满超时
+            if fr.get_by_text(pattern).count() == 0:
+                continue
+            if click_by_text(fr, texts, labels=labels):
+                return True
         except Exception:
             pass
     return False
 
-def goto(page, url: str):
-    page.goto(url, wait_until="domcontentloaded")
+def wait_ready(page, timeout: int = 2000):
+    # 资源已拦截，DOM 通常很快就绪；超时也照常继续（以前的 load 等待同样忽略超时）
     try:
-        page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)  # 更快
+        page.wait_for_load_state("domcontentloaded", timeout=timeout)
     except Exception:
         pass
-    page.wait_for_timeout(250)
+
+def wait_for_text(page, texts: Sequence[str], timeout: int = DEFAULT_TIMEOUT) -> bool:
+    # 下一步要点的文字出现在可见文本里即返回
+    try:
+        page.wait_for_function(HAS_TEXT_JS, arg=list(texts), timeout=timeout)
+        return True
+    except Exception:
+        wait_ready(page)
+        return False
+
+def goto(page, url: str, anchor: Optional[str] = None):
+    # 有锚点时只等响应提交 + 下一步要用的元素出现，不等整页 load
+    if anchor:
+        page.goto(url, wait_until="commit")
+        try:
+            page.wait_for_selector(anchor, timeout=DEFAULT_TIMEOUT)
+            return
+        except PlaywrightTimeoutError:
+            log(f"Anchor not found on {page.url}; falling back to domcontentloaded.")
+        wait_ready(page)
+        return
+    page.goto(url, wait_until="domcontentloaded")
+
+def block_heavy_resources(context):
+    if not BLOCK_ASSETS:
+        return
+
+    def handler(route):
+        req = route.request
+        if req.resource_type in BLOCKED_RESOURCE_TYPES or TRACKER_RE.search(req.url):
+            route.abort()
+        else:
+            route.continue_()
+    try:
+        context.route("**/*", handler)
+    except Exception as e:
+        log(f"Resource blocking disabled: {e}")
+
+def close_browser(context, browser):
+    for obj in (context, browser):
+        if obj is None:
+            continue
+        try:
+            obj.close()
+        except Exception:
+            pass
 
 def scroll_to_bottom(page):
     try:
         page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
     except Exception:
         pass
-    page.wait_for_timeout(300)
+    # 滚动到位即返回，不再固定睡 300ms
+    try:
+        page.wait_for_function(
+            "window.scrollY + window.innerHeight >= document.body.scrollHeight - 2", timeout=1000
+        )
+    except Exception:
+        pass
+
+# 在页面内一次完成：点含关键字的 label，再勾选前 5 个可见且未勾选的复选框
+ACCEPT_CHECKS_JS = """(keywords) => {
+    for (const label of document.querySelectorAll('label')) {
+        if (!keywords.some(k => label.innerText.includes(k))) continue;
+        const ctl = label.control;
+        if (ctl && ctl.type === 'checkbox' && ctl.checked) continue;  // 已勾选的不要点掉
+        label.click();
+    }
+    let clicked = 0;
+    Array.from(document.querySelectorAll('input[type="checkbox"]')).slice(0, 5).forEach(box => {
+        if (!box.checked && box.getClientRects().length > 0) {
+            box.click();
+            clicked++;
+        }
+    });
+    return clicked;
+}"""
 
 def accept_required_checks(page):
     # 勾选“同意/確認/承諾”等复选框，避免提交被禁用
     keywords = ["同意", "確認", "承諾", "同意します", "確認しました", "規約", "注意事項"]
-    for k in keywords:
-        try:
-            page.locator(f'label:has-text("{k}")').first.click(timeout=700)
-        except Exception:
-            pass
     try:
-        boxes = page.locator('input[type="checkbox"]')
-        count = min(boxes.count(), 5)
-        clicked = 0
-        for i in range(count):
-            el = boxes.nth(i)
-            try:
-                if el.is_visible() and not el.is_checked():
-                    el.check(timeout=700)
-                    clicked += 1
-            except Exception:
-                pass
+        clicked = page.evaluate(ACCEPT_CHECKS_JS, keywords)
         if clicked:
             log(f"Checked {clicked} agreement checkbox(es).")
-    except Exception:
-        pass
+    except Exception as e:
+        log(f"Accept checks failed: {e}")
 
 def click_submit_fallback(page):
     selectors = [
@@ -204,6 +391,22 @@ def click_submit_fallback(page):
     return False
 
 # ------------------ Logging to .md ------------------
+_MD_FILES = {}
+
+def _md_file(filepath):
+    # 首次写入时才打开（不会凭空创建空文件），进程退出时关闭
+    fh = _MD_FILES.get(filepath)
+    if fh is None:
+        fh = _MD_FILES[filepath] = open(filepath, "ab", buffering=65536)
+    return fh
+
+def close_md_files():
+    for fh in _MD_FILES.values():
+        fh.close()
+    _MD_FILES.clear()
+
+atexit.register(close_md_files)
+
 def write_success_md(filepath=RENEW_LOG_MD, tzname=LOG_TIMEZONE):
     tz = None
     try:
@@ -213,33 +416,70 @@ def write_success_md(filepath=RENEW_LOG_MD, tzname=LOG_TIMEZONE):
     now = datetime.now(tz) if tz else datetime.utcnow()
     suffix = tzname if tz else "UTC"
     line = f"{now.strftime('%Y-%m-%d %H:%M:%S')} {suffix} 成功\n"
-    with open(filepath, "a", encoding="utf-8") as f:
-        f.write(line)
+    fh = _md_file(filepath)
+    fh.write(line.encode("utf-8"))
+    # 每次运行只有这一行，立即落盘；之后关浏览器时被取消也不会丢“成功”记录
+    fh.flush()
     log(f"[write_success_md] {line.strip()} -> {filepath}")
 
 # ------------------ Auth ------------------
-def cookie_login(context, page) -> bool:
-    if not COOKIE_STR:
+def storage_state_fresh(path=STORAGE_STATE, max_age_hours=STATE_MAX_AGE_HOURS) -> bool:
+    try:
+        age = time.time() - Path(path).stat().st_mtime
+    except OSError:
         return False
-    domains = ["secure.xserver.ne.jp", "www.xserver.ne.jp"]
-    all_cookies = []
-    for d in domains:
-        all_cookies.extend(parse_cookie_string(COOKIE_STR, d))
-    if not all_cookies:
+    if age > max_age_hours * 3600:
+        log(f"Saved session is {age / 3600:.1f}h old; logging in again.")
         return False
+    return True
+
+def save_storage_state(context, path=STORAGE_STATE, keep_mtime: bool = False):
+    # keep_mtime：只刷新 Cookie 内容，保留上次真正登录的时间，TTL 照常生效
     try:
-        context.add_cookies(all_cookies)
+        p = Path(path)
+        old = p.stat() if keep_mtime and p.exists() else None
+        ensure_dir(p.parent)
+        context.storage_state(path=path)
+        if old is not None:
+            os.utime(p, (old.st_atime, old.st_mtime))
+        log(f"Saved storage state: {path}")
     except Exception as e:
-        log(f"Add cookies failed: {e}")
+        log(f"Save storage state failed: {e}")
+
+def probe_cookie_session(context, page) -> bool:
+    # 两个入口并行探测：sync API 不能跨线程，用 commit 先把两个导航都发出去再分别等待
+    probe = None
+    try:
+        probe = context.new_page()
+        page.goto(GAME_INDEX_URL, wait_until="commit")
+        probe.goto(LOGIN_URL, wait_until="commit")
+        for pg, where in ((page, "game index"), (probe, "login URL")):
+            try:
+                pg.wait_for_selector(SESSION_ANCHOR, timeout=DEFAULT_TIMEOUT)
+            except Exception:
+                pass
+            snap(pg, f"after_cookie_goto_{where.replace(' ', '_')}")
+            if is_logged_in(pg):
+                # 后续 main 会把 page 导航回列表页，哪个标签页命中都一样
+                log(f"Logged in via cookie ({where}).")
+                return True
         return False
+    except Exception as e:
+        log(f"Parallel cookie probe failed ({e}); probing sequentially.")
+    finally:
+        if probe is not None:
+            try:
+                probe.close()
+            except Exception:
+                pass
 
-    goto(page, GAME_INDEX_URL)
+    goto(page, GAME_INDEX_URL, SESSION_ANCHOR)
     snap(page, "after_cookie_goto_game_index")
     if is_logged_in(page):
         log("Logged in via cookie (game index).")
         return True
 
-    goto(page, LOGIN_URL)
+    goto(page, LOGIN_URL, SESSION_ANCHOR)
     snap(page, "after_cookie_goto_login")
     if is_logged_in(page):
         log("Logged in via cookie (login URL).")
@@ -247,92 +487,142 @@ def cookie_login(context, page) -> bool:
 
     return False
 
-def password_login(page) -> bool:
-    if not EMAIL or not PASSWORD:
+def add_cookies(context, domain: str) -> bool:
+    cookies = parse_cookie_string(COOKIE_STR, domain)
+    if not cookies:
+        return False
+    try:
+        context.add_cookies(cookies)
+        return True
+    except Exception as e:
+        log(f"Add cookies failed ({domain}): {e}")
+        return False
+
+def cookie_session_valid(context) -> Optional[bool]:
+    # 用 APIRequestContext（共享 context 的 Cookie，不渲染页面）看列表页是否被重定向到登录页；
+    # 只有落到登录页才算无效，请求失败或非 2xx 时返回 None，由调用方退回浏览器探测
+    try:
+        resp = context.request.get(GAME_INDEX_URL, timeout=DEFAULT_TIMEOUT)
+    except Exception as e:
+        log(f"Cookie HTTP probe failed: {e}")
+        return None
+    log(f"Cookie HTTP probe: {resp.status} {resp.url}")
+    if "/login" in resp.url:
+        return False
+    # 5xx 或对非浏览器请求的 403/503 拦截说明不了 Cookie 是否有效，交给浏览器再看
+    return True if resp.ok else None
+
+def cookie_login(context, page) -> bool:
+    if not COOKIE_STR:
+        return False
+    # 面板在 secure 域下，只注入这一份（www 域的 Cookie 不会发往 secure，探测结果不会变）
+    if not add_cookies(context, "secure.xserver.ne.jp"):
+        return False
+    valid = cookie_session_valid(context)
+    if valid is None:
+        return probe_cookie_session(context, page)
+    if not valid:
+        log("Cookie rejected (redirected to login).")
         return False
-    goto(page, LOGIN_URL)
-    snap(page, "login_form_loaded")
 
-    # 邮箱/ID
-    filled_email = False
-    for label in ["メールアドレス", "ログインID", "アカウントID", "ID", "メール"]:
+    goto(page, GAME_INDEX_URL, SESSION_ANCHOR)
+    snap(page, "after_cookie_goto_game_index")
+    if is_logged_in(page):
+        log("Logged in via cookie (game index).")
+        return True
+    return False
+
+# 排除密码框/按钮，避免 name*="login" 之类误命中
+_NOT_TEXT_INPUT = ':not([type="password"]):not([type="submit"]):not([type="button"]):not([type="checkbox"])'
+EMAIL_INPUT_SEL = (
+    'input:is([type="email"], [name*="mail"], [name*="login"], [name*="account"], '
+    '[name*="user"], [id*="mail"], [id*="login"])' + _NOT_TEXT_INPUT
+)
+EMAIL_INPUT_FALLBACK_SEL = 'input:is([name*="id"], [id*="account"], [id*="user"], [id*="id"])' + _NOT_TEXT_INPUT
+PASSWORD_INPUT_SEL = 'input[type="password"], input[name*="pass"], input[id*="pass"]'
+
+def fill_first_visible(page, selector: str, value: str) -> bool:
+    try:
+        page.locator(f"{selector} >> visible=true").first.fill(value, timeout=SHORT_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+def fill_by_labels(page, labels: List[str], value: str) -> bool:
+    for label in labels:
         try:
             loc = page.get_by_label(label, exact=False)
             if loc.count() > 0:
-                loc.first.fill(EMAIL, timeout=SHORT_TIMEOUT)
-                filled_email = True
-                break
+                loc.first.fill(value, timeout=SHORT_TIMEOUT)
+                return True
         except Exception:
             pass
+    return False
+
+def password_login(page) -> bool:
+    if not EMAIL or not PASSWORD:
+        return False
+    goto(page, LOGIN_URL, SESSION_ANCHOR)
+    snap(page, "login_form_loaded")
+
+    # 邮箱/ID：先一个并集选择器直接填，失败再按 label、再按宽泛的 name/id 兜底
+    filled_email = (
+        fill_first_visible(page, EMAIL_INPUT_SEL, EMAIL)
+        or fill_by_labels(page, ["メールアドレス", "ログインID", "アカウントID", "ID", "メール"], EMAIL)
+        or fill_first_visible(page, EMAIL_INPUT_FALLBACK_SEL, EMAIL)
+    )
     if not filled_email:
-        for css in [
-            'input[type="email"]','input[name*="mail"]','input[id*="mail"]',
-            'input[name*="login"]','input[name*="account"]','input[name*="user"]','input[name*="id"]',
-            'input[id*="login"]','input[id*="account"]','input[id*="user"]','input[id*="id"]',
-        ]:
-            try:
-                loc = page.locator(css)
-                if loc.count() > 0:
-                    loc.first.fill(EMAIL, timeout=SHORT_TIMEOUT)
-                    filled_email = True
-                    break
-            except Exception:
-                pass
+        log("Could not find the email/ID input.")
 
     # 密码
-    filled_pwd = False
-    for label in ["パスワード", "Password"]:
-        try:
-            loc = page.get_by_label(label, exact=False)
-            if loc.count() > 0:
-                loc.first.fill(PASSWORD, timeout=SHORT_TIMEOUT)
-                filled_pwd = True
-                break
-        except Exception:
-            pass
-    if not filled_pwd:
-        for css in ['input[type="password"]','input[name*="pass"]','input[id*="pass"]']:
-            try:
-                loc = page.locator(css)
-                if loc.count() > 0:
-                    loc.first.fill(PASSWORD, timeout=SHORT_TIMEOUT)
-                    filled_pwd = True
-                    break
-            except Exception:
-                pass
+    filled_pwd = (
+        fill_first_visible(page, PASSWORD_INPUT_SEL, PASSWORD)
+        or fill_by_labels(page, ["パスワード", "Password"], PASSWORD)
+    )
 
     # 提交
-    clicked = click_by_text(page, ["ログイン", "ログインする", "サインイン", "ログオン", "ログインへ"])
+    clicked = click_by_text(page, ["ログイン", "ログインする", "サインイン", "ログオン", "ログインへ"], labels=False)
     if not clicked and filled_pwd:
         try:
             page.keyboard.press("Enter")
         except Exception:
             pass
 
+    # 登录成功会离开登录页；等 URL 变化而不是立刻检查旧页面
     try:
-        page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
+        page.wait_for_url(lambda url: "/login" not in url, timeout=DEFAULT_TIMEOUT)
     except Exception:
         pass
+    wait_ready(page)
     snap(page, "after_login_submit")
     return is_logged_in(page)
 
 # ------------------ Navigation ------------------
-UPGRADE_TEXTS = [
+UPGRADE_TEXTS = (
     "アップグレード・期限延長", "アップグレード/期限延長", "アップグレード ・ 期限延長",
     "期限延長", "期限を延長する", "更新", "更新手続き",
     "プラン変更・期限延長", "プラン変更"
-]
-DETAIL_TEXTS = ["詳細", "管理", "設定", "ゲーム詳細", "サービス詳細", "契約情報", "メニュー"]
-CONTRACT_TEXTS = ["契約", "契約情報", "料金", "お支払い", "支払い", "請求", "更新", "延長", "プラン変更"]
+)
+DETAIL_TEXTS = ("詳細", "管理", "設定", "ゲーム詳細", "サービス詳細", "契約情報", "メニュー")
+# 各步骤页面的锚点文字：出现即说明已到下一页
+MGMT_PAGE_TEXTS = ("アップグレード", "期限延長")
+EXTEND_ENTRY_TEXTS = ("期限を延長する", "延長する")
+CONTRACT_TEXTS = ("契約", "契約情報", "料金", "お支払い", "支払い", "請求", "更新", "延長", "プラン変更")
 
 def ensure_on_game_index(page):
-    goto(page, GAME_INDEX_URL)
+    # 登录探测通常已停在列表页，不再重复加载；但列表可能还没渲染完，照样等锚点
+    if page.url.startswith(GAME_INDEX_URL):
+        try:
+            page.wait_for_selector(GAME_MGMT_ANCHOR, timeout=DEFAULT_TIMEOUT)
+        except PlaywrightTimeoutError:
+            log("'ゲーム管理' not visible on game index yet; continuing.")
+        return
+    goto(page, GAME_INDEX_URL, SESSION_ANCHOR)
     snap(page, "on_game_index")
 
 def navigate_to_game_management(page) -> bool:
     # 登录后在列表页，点击表格行的蓝色“ゲーム管理”按钮
-    goto(page, GAME_INDEX_URL)
-    snap(page, "on_game_index_again")
+    ensure_on_game_index(page)
 
     def click_row_btn(row) -> bool:
         selectors = [
@@ -351,16 +641,26 @@ def navigate_to_game_management(page) -> bool:
                 pass
         return False
 
+    # 快速路径：一个复合定位器直达（目标行的）“ゲーム管理”，一次等待一次点击
+    rows = page.locator("tbody tr")
+    if TARGET_GAME:
+        rows = rows.filter(has_text=TARGET_GAME)
+    try:
+        btn = rows.locator(GAME_MGMT_ANCHOR).first
+        btn.wait_for(state="visible", timeout=SHORT_TIMEOUT)
+        btn.click(timeout=SHORT_TIMEOUT)
+        wait_for_text(page, MGMT_PAGE_TEXTS)
+        return True
+    except Exception as e:
+        log(f"Direct 'ゲーム管理' click failed, trying fallbacks: {e}")
+
     # 优先按 TARGET_GAME 锁定行（你的“ゲームサーバー名”）
     if TARGET_GAME:
         try:
             row = page.locator("tbody tr").filter(has_text=TARGET_GAME)
             if row.count() > 0 and click_row_btn(row.first):
                 snap(page, "clicked_row_game_management_target")
-                try:
-                    page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
-                except Exception:
-                    pass
+                wait_for_text(page, MGMT_PAGE_TEXTS)
                 return True
         except Exception:
             pass
@@ -379,10 +679,7 @@ def navigate_to_game_management(page) -> bool:
             if loc.count() > 0 and loc.first.is_visible():
                 if try_click(page, loc.first, timeout=1500):
                     snap(page, "clicked_row_game_management_first")
-                    try:
-                        page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
-                    except Exception:
-                        pass
+                    wait_for_text(page, MGMT_PAGE_TEXTS)
                     return True
         except Exception:
             pass
@@ -396,17 +693,13 @@ def navigate_to_game_management(page) -> bool:
             row = rows.nth(i)
             if click_row_btn(row):
                 snap(page, f"clicked_row_game_management_index_{i}")
-                try:
-                    page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
-                except Exception:
-                    pass
+                wait_for_text(page, MGMT_PAGE_TEXTS)
                 return True
     except Exception:
         pass
 
     log("Row-level 'ゲーム管理' button not found on list page.")
-    snap(page, "game_management_not_found")
-    dump_html(page, "game_management_not_found")
+    snap_error(page, "game_management_not_found")
     return False
 
 def open_game_detail(page) -> bool:
@@ -427,34 +720,78 @@ def open_game_detail(page) -> bool:
 
 def click_upgrade_or_extend(page) -> bool:
     if click_text_global(page, UPGRADE_TEXTS):
+        wait_for_text(page, EXTEND_ENTRY_TEXTS)
         snap(page, "after_click_upgrade_extend")
         return True
 
     # 兜底：进入“詳細/管理/設定”或“契約/料金/更新”再找
     if open_game_detail(page):
-        try:
-            page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
-        except Exception:
-            pass
+        wait_ready(page)
         snap(page, "after_open_detail")
         if click_text_global(page, UPGRADE_TEXTS):
+            wait_for_text(page, EXTEND_ENTRY_TEXTS)
             snap(page, "after_click_upgrade_extend_from_detail")
             return True
-        if click_text_global(page, ["契約", "契約情報", "料金", "お支払い", "支払い", "請求", "更新", "延長", "プラン変更"]):
-            try:
-                page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
-            except Exception:
-                pass
+        if click_text_global(page, CONTRACT_TEXTS):
+            wait_ready(page)
             snap(page, "after_open_contract_or_billing")
             if click_text_global(page, UPGRADE_TEXTS):
+                wait_for_text(page, EXTEND_ENTRY_TEXTS)
                 snap(page, "after_click_upgrade_extend_from_contract")
                 return True
 
-    snap(page, "open_upgrade_extend_failed")
-    dump_html(page, "open_upgrade_extend_failed")
+    snap_error(page, "open_upgrade_extend_failed")
     return False
 
 # ------------------ Extend ------------------
+FINAL_SUBMIT_TEXTS = (
+    "期限を延長する", "延長する", "実行する",
+    "延長を確定する", "確定する",
+    "申込みを確定する", "お申し込みを確定する",
+    "申込を確定する", "お申込みを確定する"
+)
+SUCCESS_MARKERS = ("延長", "完了", "処理が完了", "更新されました", "受け付けました", "受付しました", "手続きが完了")
+
+def is_panel_post(response) -> bool:
+    return response.request.method == "POST" and "xserver.ne.jp" in response.url
+
+_selector_cache = None
+
+def selector_cache() -> dict:
+    global _selector_cache
+    if _selector_cache is None:
+        try:
+            _selector_cache = json.loads(Path(SELECTOR_CACHE).read_text(encoding="utf-8"))
+        except Exception:
+            _selector_cache = {}
+    return _selector_cache
+
+def remember_selector(key: str, value):
+    cache = selector_cache()
+    if value is None:
+        if cache.pop(key, None) is None:
+            return
+    elif cache.get(key) == value:
+        return
+    else:
+        cache[key] = value
+    # 临时文件 + os.replace，避免写一半被下次读到
+    try:
+        path = Path(SELECTOR_CACHE)
+        ensure_dir(path.parent)
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    except Exception as e:
+        log(f"Selector cache write failed: {e}")
+
+def hours_locator(page, strategy: str, value: str):
+    if strategy == "label":
+        # label 点击即选中对应 radio；aria-label 的 radio 由 get_by_role 覆盖
+        return page.locator(f'label:has-text("{value}")').or_(page.get_by_role("radio", name=value, exact=False))
+    return page.locator(value)
+
 def select_hours(page, hours: int) -> bool:
     hours_str = str(hours)
     texts = [
@@ -463,32 +800,29 @@ def select_hours(page, hours: int) -> bool:
         f"+{hours_str}時間", f"＋{hours_str}時間",
         f"{hours_str}時間", f"{hours_str} 時間",
     ]
-    for t in texts:
-        try:
-            if try_click(page, page.get_by_label(t, exact=False)):
-                return True
-        except Exception:
-            pass
-    for t in texts:
-        try:
-            if try_click(page, page.get_by_role("radio", name=t, exact=False)):
-                return True
-        except Exception:
-            pass
-    for t in texts:
+    candidates = [("label", t) for t in texts] + [
+        # radio 优先于其它带 value 的 input（如隐藏字段）
+        ("css", f'input[type="radio"][value="{hours_str}"], input[type="radio"][value*="{hours_str}"]'),
+        ("css", f'input[value="{hours_str}"], input[value*="{hours_str}"]'),
+    ]
+
+    # 先试上次成功的那一个（给足等待），失效则清掉
+    key = f"hours_{hours_str}"
+    cached = selector_cache().get(key)
+    if cached:
         try:
-            if try_click(page, page.locator(f'label:has-text("{t}")')):
+            if try_click(page, hours_locator(page, *cached), timeout=DEFAULT_TIMEOUT, settle_ms=200):
                 return True
         except Exception:
             pass
-    for sel in [
-        f'input[type="radio"][value="{hours_str}"]',
-        f'input[type="radio"][value*="{hours_str}"]',
-        f'input[value="{hours_str}"]',
-        f'input[value*="{hours_str}"]',
-    ]:
+        remember_selector(key, None)
+
+    for strategy, value in candidates:
+        if [strategy, value] == cached:
+            continue
         try:
-            if try_click(page, page.locator(sel)):
+            if try_click(page, hours_locator(page, strategy, value), settle_ms=200):
+                remember_selector(key, [strategy, value])
                 return True
         except Exception:
             pass
@@ -497,120 +831,146 @@ def select_hours(page, hours: int) -> bool:
 def do_extend_hours(page, hours: int) -> bool:
     # 进入续期入口（页面底部“期限を延長する”）
     scroll_to_bottom(page)
-    click_text_global(page, ["期限を延長する", "延長する"])
-    try:
-        page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
-    except Exception:
-        pass
+    click_text_global(page, EXTEND_ENTRY_TEXTS)
+    wait_for_text(page, (f"{hours}時間", f"{hours} 時間"))
     snap(page, "after_click_entry_extend")
 
     # 选择时长
     if not select_hours(page, hours):
         log(f"Could not select +{hours}時間 option. It may be unavailable or UI changed.")
-        snap(page, f"failed_select_{hours}h")
+        snap_error(page, f"failed_select_{hours}h")
     else:
         snap(page, f"selected_{hours}h")
 
     accept_required_checks(page)
 
     # 確認画面に進む
-    if not click_text_global(page, ["確認画面に進む", "確認へ進む", "確認画面へ", "確認"]):
+    if not click_text_global(page, ["確認画面に進む", "確認へ進む", "確認画面へ", "確認"], labels=False):
         log("Could not find 確認画面に進む. Maybe already on confirm page.")
     else:
-        try:
-            page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
-        except Exception:
-            pass
+        wait_for_text(page, FINAL_SUBMIT_TEXTS)
         snap(page, "after_go_confirm")
 
     scroll_to_bottom(page)
     accept_required_checks(page)
 
     # 最终提交
-    final_texts = [
-        "期限を延長する", "延長する", "実行する",
-        "延長を確定する", "確定する",
-        "申込みを確定する", "お申し込みを確定する",
-        "申込を確定する", "お申込みを確定する"
-    ]
-    if not click_text_global(page, final_texts):
-        if not click_submit_fallback(page):
-            log("Could not find the final submit button.")
-            snap(page, "failed_final_extend_click")
-            return False
-
+    # 监听点击触发的 POST，后端一返回就继续；没捕获到再退回等待 load
+    clicked = False
     try:
-        page.wait_for_load_state("load", timeout=DEFAULT_TIMEOUT)
-    except Exception:
-        pass
+        with page.expect_response(is_panel_post, timeout=DEFAULT_TIMEOUT) as resp_info:
+            clicked = click_text_global(page, FINAL_SUBMIT_TEXTS, labels=False) or click_submit_fallback(page)
+            if not clicked:
+                raise LookupError("final submit button not found")
+        resp = resp_info.value
+        log(f"Submit response: HTTP {resp.status} {resp.url}")
+        wait_ready(page)
+    except Exception as e:
+        if clicked:
+            log(f"No submit response observed ({e}); waiting for page load.")
+            wait_ready(page)
+    if not clicked:
+        log("Could not find the final submit button.")
+        snap_error(page, "failed_final_extend_click")
+        return False
     snap(page, "after_extend_submit")
 
     # 成功判定（宽松）
-    for t in ["延長", "完了", "処理が完了", "更新されました", "受け付けました", "受付しました", "手続きが完了"]:
-        try:
-            if page.get_by_text(t, exact=False).first.is_visible():
-                log("Extension likely succeeded.")
-                return True
-        except Exception:
-            pass
+    # 一次取回可见文本，在本地匹配（innerText 不含隐藏元素）
+    try:
+        body = page.evaluate("() => document.body.innerText")
+    except Exception:
+        body = ""
+    if any(m in body for m in SUCCESS_MARKERS):
+        log("Extension likely succeeded.")
+        return True
     log("Did not detect a success message; treating as success but please review screenshots.")
+    snap_error(page, "extend_success_unconfirmed")
     return True
 
 # ------------------ Main ------------------
+def hard_exit(rc: int):
+    # 一次性进程：自己的缓冲落盘后直接退出，跳过 Playwright/Chromium 的优雅关闭，
+    # driver 与 Chromium 子进程在管道断开后退出、由系统回收
+    _SNAP_EXEC.shutdown(wait=True)
+    close_md_files()
+    _LOG_BUF.flush()
+    os._exit(rc)
+
 def main():
     if not COOKIE_STR and (not EMAIL or not PASSWORD):
-        log("No cookie provided and missing EMAIL/PASSWORD. Please set GitHub Secrets.")
+        log("No cookie provided and missing EMAIL/PASSWORD. Please set GitHub Secrets.", flush=True)
         sys.exit(1)
 
     with sync_playwright() as p:
-        browser = p.chromium.launch(
-            headless=HEADLESS,
-            args=["--no-sandbox", "--disable-gpu", "--disable-dev-shm-usage"]
-        )
-        context = browser.new_context(
+        has_state = storage_state_fresh()
+        context_kwargs = dict(
             viewport={"width": 1280, "height": 900},
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         )
-        page = context.new_page()
-        page.set_default_timeout(DEFAULT_TIMEOUT)
-
-        # 登录：先 Cookie，后账号密码
-        logged_in = False
-        if COOKIE_STR:
-            log("Trying cookie login...")
+        browser = None
+        if USER_DATA_DIR:
+            # persistent context 直接返回 context，没有单独的 browser 对象
+            ensure_dir(Path(USER_DATA_DIR))
+            log(f"Using persistent profile: {USER_DATA_DIR}")
+            context = p.chromium.launch_persistent_context(
+                USER_DATA_DIR, headless=HEADLESS, args=CHROMIUM_ARGS, **context_kwargs
+            )
+        else:
+            browser = p.chromium.launch(headless=HEADLESS, args=CHROMIUM_ARGS)
+            if has_state:
+                context_kwargs["storage_state"] = STORAGE_STATE
+            context = browser.new_context(**context_kwargs)
+        context.set_default_timeout(ACTION_TIMEOUT)
+        context.set_default_navigation_timeout(DEFAULT_TIMEOUT)
+        block_heavy_resources(context)
+        page = context.pages[0] if context.pages else context.new_page()
+
+        # 登录：先复用已保存的登录态，再 Cookie，最后账号密码
+        # 两种模式都按 state.json 的 mtime 判断 TTL（persistent profile 下它只作 TTL 标记）；
+        # 未过期时先复用 profile/登录态，命中就不会再用静态 XSERVER_COOKIE 覆盖
+        logged_in = reused = False
+        if has_state:
+            log("Trying saved session...", flush=True)
+            goto(page, GAME_INDEX_URL, SESSION_ANCHOR)
+            logged_in = reused = is_logged_in(page)
+            if reused:
+                log("Logged in via saved session.")
+        if not logged_in and COOKIE_STR:
+            log("Trying cookie login...", flush=True)
             logged_in = cookie_login(context, page)
         if not logged_in and EMAIL and PASSWORD:
-            log("Trying password login...")
+            log("Trying password login...", flush=True)
             logged_in = password_login(page)
+        if logged_in and not reused:
+            # 新登录成功后立即保存；复用时不覆盖，保证按 TTL 定期重新登录
+            save_storage_state(context)
 
         if not logged_in:
-            snap(page, "login_failed")
-            log("Login failed. Check credentials/cookie.")
-            context.close()
-            browser.close()
+            snap_error(page, "login_failed")
+            log("Login failed. Check credentials/cookie.", flush=True)
+            close_browser(context, browser)
             sys.exit(2)
 
         # 登录后到 xmgame/index
         ensure_on_game_index(page)
 
         # ゲーム管理（表格行内按钮）
-        log("Navigating to Game Management...")
+        log("Navigating to Game Management...", flush=True)
         if not navigate_to_game_management(page):
-            log("Could not open ゲーム管理. Exiting.")
-            context.close()
-            browser.close()
+            log("Could not open ゲーム管理. Exiting.", flush=True)
+            close_browser(context, browser)
             sys.exit(3)
 
         # アップグレード・期限延長
-        log("Opening アップグレード・期限延長...")
+        log("Opening アップグレード・期限延長...", flush=True)
         if not click_upgrade_or_extend(page):
-            log("Could not open upgrade/extend page. Exiting.")
-            context.close()
-            browser.close()
+            log("Could not open upgrade/extend page. Exiting.", flush=True)
+            close_browser(context, browser)
             sys.exit(3)
 
         # 执行续期
-        log(f"Performing +{RENEW_HOURS}h extension...")
+        log(f"Performing +{RENEW_HOURS}h extension...", flush=True)
         success = do_extend_hours(page, RENEW_HOURS)
 
         if success:
@@ -621,9 +981,16 @@ def main():
             log("Extension step reported failure.")
             rc = 4
 
-        context.close()
-        browser.close()
-        sys.exit(rc)
+        # 收尾时写回服务端刷新过的 Cookie，下次直接复用
+        save_storage_state(context, keep_mtime=True)
+        if USER_DATA_DIR:
+            # persistent profile 需要正常关闭，Cookie 才会写回磁盘
+            close_browser(context, browser)
+        hard_exit(rc)
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # 先于 traceback 输出，保证日志顺序
+        _LOG_BUF.flush()